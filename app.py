@@ -1,31 +1,22 @@
 import streamlit as st
 from PIL import Image
-import io
-import base64
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-import hashlib
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import fpdf.fpdf
 from fpdf import FPDF
+from common import (
+    GEMINI, MAX_WORKERS, make_thumbnail, file_digest_hash, hash_files, is_duplicate,
+    identify_items, recipe_prompt, split_recipes, generate_recipe, stream_recipe,
+)
 
 # Load environment variables
 load_dotenv()
 
-# Set up Google Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-# Set up the model
-generation_config = {
-    "temperature": 1,
-    "top_p": 0.95,
-    "top_k": 64,
-    "max_output_tokens": 8192,
-}
-model = genai.GenerativeModel(
-    model_name="gemini-1.5-pro",
-    generation_config=generation_config,
-)
+# Unicode TrueType font for the recipes PDF, shipped with the app (see fonts/LICENSE)
+PDF_FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "DejaVuSans.ttf")
+# Don't read or write font-metric pickles next to the TTF; builds are already cached per recipes
+fpdf.fpdf.FPDF_CACHE_MODE = 1
 
 # Set page config
 st.set_page_config(page_title="Chef's Fridge Recipe Generator", layout="wide", page_icon="🍴")
@@ -104,77 +95,65 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 # Helper functions
-def image_to_bytes(image):
-    buffered = io.BytesIO()
-    image.save(buffered, format="JPEG")
-    return buffered.getvalue()
-
-def image_hash(image):
-    return hashlib.md5(image_to_bytes(image)).hexdigest()
-
-def is_duplicate(new_image, existing_images):
-    new_hash = image_hash(new_image)
-    for img in existing_images:
-        if image_hash(img) == new_hash:
-            return True
-    return False
-
-def identify_items(images):
-    all_items = []
-    for image in images:
-        base64_image = base64.b64encode(image_to_bytes(image)).decode('utf-8')
-
-        try:
-            response = model.generate_content([
-                "List all the food items you can see in this fridge image. Provide the list in a comma-separated format.",
-                {"mime_type": "image/jpeg", "data": base64_image}
-            ])
-
-            items = response.text.split(',')
-            all_items.extend([item.strip() for item in items])
-        except Exception as e:
-            st.error(f"An error occurred while identifying items: {str(e)}")
-
-    return list(set(all_items))  # Remove duplicates
-
-def generate_recipe(items, diet_preference, cuisine_preference):
+def _stream_recipes(ingredients, diet_preference, cuisine_preference, num_recipes):
+    prompt = recipe_prompt(ingredients, diet_preference, cuisine_preference, num_recipes)
+
+    # Render tokens as they arrive, then clear the draft once the full text is in (or the stream fails)
+    placeholder = st.empty()
     try:
-        diet_instruction = f"The recipe should be {diet_preference.lower()}." if diet_preference != "None" else ""
-        cuisine_instruction = f"The recipe should be {cuisine_preference} cuisine." if cuisine_preference != "Any" else ""
+        with placeholder.container():
+            text = st.write_stream(stream_recipe(prompt, GEMINI, num_recipes))
+    finally:
+        placeholder.empty()
 
-        prompt = f"Create a recipe using these ingredients: {', '.join(items)}. {diet_instruction} {cuisine_instruction} Provide the recipe name, ingredients with quantities, and step-by-step instructions."
+    return split_recipes(text, num_recipes)
 
-        response = model.generate_content(prompt)
+def generate_multiple_recipes(items, diet_preference, cuisine_preference, num_recipes):
+    ingredients = ', '.join(items)
 
-        return response.text
+    # Ask for all recipes in one streamed prompt; if that fails outright (e.g. rate limited),
+    # report it rather than sending one more request per recipe
+    try:
+        recipes = _stream_recipes(ingredients, diet_preference, cuisine_preference, num_recipes)
     except Exception as e:
-        st.error(f"An error occurred while generating the recipe: {str(e)}")
-        return "Unable to generate recipe. Please try again."
-
-def generate_multiple_recipes(items, diet_preference, cuisine_preference, num_recipes):
-    recipes = []
-    for _ in range(num_recipes):
-        recipe = generate_recipe(items, diet_preference, cuisine_preference)
-        recipes.append(recipe)
+        st.error(f"An error occurred while generating the recipes: {str(e)}")
+        return []
+
+    # Top up with one request per recipe the batch came back short of
+    missing = num_recipes - len(recipes)
+    if missing == 0:
+        return recipes
+
+    prompt = recipe_prompt(ingredients, diet_preference, cuisine_preference)
+    # Requests run in worker threads; errors are reported from the script thread
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, missing)) as executor:
+        futures = [executor.submit(generate_recipe, prompt, GEMINI) for _ in range(missing)]
+        for future in futures:
+            try:
+                recipes.append(future.result())
+            except Exception as e:
+                st.error(f"An error occurred while generating the recipe: {str(e)}")
+                recipes.append("Unable to generate recipe. Please try again.")
     return recipes
 
-def get_pdf_download_link(recipes):
+# Cached on the recipe texts, so reruns with unchanged recipes reuse the built PDF
+@st.cache_data(show_spinner=False, max_entries=16)
+def get_pdf_bytes(recipes):
     pdf = FPDF()
     pdf.add_page()
     pdf.set_auto_page_break(auto=True, margin=15)
 
-    # Use a default font
-    pdf.set_font("Arial", size=12)
+    pdf.add_font("DejaVu", "", PDF_FONT_PATH, uni=True)
+    pdf.set_font("DejaVu", size=12)
 
     for i, recipe in enumerate(recipes, 1):
+        # FPDF's TrueType support stops at the Basic Multilingual Plane, so emoji are dropped
+        recipe = "".join(c for c in recipe if ord(c) <= 0xFFFF)
         pdf.cell(200, 10, txt=f"Recipe {i}", ln=True, align="C")
         pdf.multi_cell(0, 10, txt=recipe)
         pdf.ln(10)
 
-    pdf_output = pdf.output(dest="S").encode("latin-1", errors="ignore")
-    b64 = base64.b64encode(pdf_output).decode()
-    href = f'<a href="data:application/pdf;base64,{b64}" download="recipes.pdf">Download PDF File</a>'
-    return href
+    return pdf.output(dest="S").encode("latin-1", errors="ignore")
 
 # Initialize session state
 def init_session_state():
@@ -182,6 +161,8 @@ def init_session_state():
         st.session_state.page = 'Home'
     if 'images' not in st.session_state:
         st.session_state.images = []
+    if 'image_hashes' not in st.session_state:
+        st.session_state.image_hashes = set()
     if 'ingredients' not in st.session_state:
         st.session_state.ingredients = []
     if 'recipes' not in st.session_state:
@@ -233,24 +214,31 @@ def upload_images_page():
     if image_option == "Take Pictures":
         camera_image = st.camera_input("📷 Take a picture of your fridge contents")
         if camera_image:
-            new_image = Image.open(camera_image)
-            if not is_duplicate(new_image, st.session_state.images):
-                st.session_state.images.append(new_image)
+            h = file_digest_hash(camera_image)
+            if not is_duplicate(h, st.session_state.image_hashes):
+                thumbnail = make_thumbnail(Image.open(camera_image))
+                st.session_state.images.append({"bytes": camera_image.getvalue(), "type": camera_image.type, "thumb": thumbnail})
+                st.session_state.image_hashes.add(h)
                 st.success("Image added successfully! 🎉")
             else:
                 st.warning("This image is a duplicate and was not added.")
     else:
         uploaded_files = st.file_uploader("📤 Upload fridge images", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
         if uploaded_files:
-            new_images = 0
-            duplicates = 0
-            for uploaded_file in uploaded_files:
-                new_image = Image.open(uploaded_file)
-                if not is_duplicate(new_image, st.session_state.images):
-                    st.session_state.images.append(new_image)
-                    new_images += 1
-                else:
-                    duplicates += 1
+            # Hash the whole batch first, then add every new image in one step
+            hashes = hash_files(uploaded_files)
+            fresh = {}
+            for uploaded_file, h in zip(uploaded_files, hashes):
+                if not is_duplicate(h, st.session_state.image_hashes) and h not in fresh:
+                    fresh[h] = uploaded_file
+
+            st.session_state.images.extend(
+                {"bytes": f.getvalue(), "type": f.type, "thumb": make_thumbnail(Image.open(f))}
+                for f in fresh.values()
+            )
+            st.session_state.image_hashes.update(fresh.keys())
+            new_images = len(fresh)
+            duplicates = len(uploaded_files) - new_images
 
             if new_images > 0:
                 st.success(f"{new_images} new image(s) added successfully! 🎉")
@@ -261,10 +249,11 @@ def upload_images_page():
         st.subheader("Captured/Uploaded Images")
         cols = st.columns(3)
         for i, img in enumerate(st.session_state.images):
-            cols[i % 3].image(img, caption=f'Image {i+1}', use_column_width=True)
+            cols[i % 3].image(img["thumb"], caption=f'Image {i+1}', use_column_width=True)
 
         if st.button('🗑️ Clear All Images', use_container_width=True):
             st.session_state.images = []
+            st.session_state.image_hashes = set()
             st.rerun()
 
     # Navigation buttons
@@ -296,7 +285,7 @@ def identify_ingredients_page():
 
     if st.button('🔍 Identify Ingredients', use_container_width=True):
         with st.spinner('Analyzing fridge contents... 🕵️‍♂️'):
-            identified_items = identify_items(st.session_state.images)
+            identified_items = identify_items(st.session_state.images, GEMINI)
             st.session_state.ingredients = identified_items
 
     if st.session_state.ingredients:
@@ -359,8 +348,9 @@ def generate_recipe_page():
         for i, recipe in enumerate(st.session_state.recipes, 1):
             st.markdown(f'<div class="recipe-container"><h3>Recipe {i}</h3>{recipe}</div>', unsafe_allow_html=True)
 
-        # Provide download link
-        st.markdown(get_pdf_download_link(st.session_state.recipes), unsafe_allow_html=True)
+        # Provide download button
+        st.download_button("📄 Download PDF", data=get_pdf_bytes(tuple(st.session_state.recipes)),
+                           file_name="recipes.pdf", mime="application/pdf", use_container_width=True)
 
     # Navigation button
     if st.button('⬅️ Back to Ingredients', key='back_to_ingredients', use_container_width=True):
@@ -0,0 +1,222 @@
+import streamlit as st
+from PIL import Image, ImageOps
+import io
+try:
+    # SIMD-accelerated drop-in replacement, used when installed
+    import pybase64 as base64
+except ImportError:
+    import base64
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import time
+import functools
+
+# Model providers
+GEMINI = "gemini"
+OPENAI = "openai"
+
+# Cap on concurrent API requests, to stay within rate limits
+MAX_WORKERS = 8
+# Longest side, in pixels, of images sent to the vision model
+MAX_IMAGE_SIZE = 1024
+# Longest side, in pixels, of the previews kept in session state
+THUMBNAIL_SIZE = 512
+# Retries for rate-limited (429) requests, with exponential backoff
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+# Separates recipes when several are requested in a single prompt
+RECIPE_DELIMITER = "###RECIPE###"
+# OpenAI completion budget for each requested recipe
+OPENAI_RECIPE_MAX_TOKENS = 500
+
+IDENTIFY_PROMPT = "List all the food items you can see in this fridge image. Provide the list in a comma-separated format."
+
+# Set up the Gemini model
+generation_config = {
+    "temperature": 1,
+    "top_p": 0.95,
+    "top_k": 64,
+    "max_output_tokens": 8192,
+}
+
+# Clients are created once per server process and shared across reruns and sessions
+@st.cache_resource
+def get_gemini_model():
+    # Imported lazily to keep the SDK out of the app's cold start
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel(
+        model_name="gemini-1.5-pro",
+        generation_config=generation_config,
+    )
+
+@st.cache_resource
+def get_openai_client():
+    from openai import OpenAI
+
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Image helpers
+def image_to_bytes(image):
+    # Vision models downscale large images anyway, so send at most MAX_IMAGE_SIZE px.
+    # Re-encoding drops EXIF, so apply its orientation to the pixels first
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    image.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE), Image.LANCZOS)
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=85, optimize=True)
+    return buffered.getvalue()
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE):
+    # Shrinks in place: callers hand over an image they no longer need, and skipping the copy
+    # lets PIL use JPEG draft mode instead of decoding the full-resolution image
+    image.thumbnail((size, size))
+    return image
+
+def prepare_image(image_bytes, mime_type):
+    # Send small JPEGs as-is to skip a re-encode. PNGs are usually far larger than the JPEG
+    # re-encode, and metadata (e.g. GPS in EXIF) must not reach the API, so those are re-encoded
+    with Image.open(io.BytesIO(image_bytes)) as decoded:
+        has_metadata = "exif" in decoded.info or "xmp" in decoded.info
+        if mime_type == "image/jpeg" and not has_metadata and max(decoded.size) <= MAX_IMAGE_SIZE:
+            return image_bytes, mime_type
+        return image_to_bytes(decoded), "image/jpeg"
+
+def file_digest_hash(file):
+    # Digest the file in place (zero-copy for in-memory uploads) rather than slurping a copy
+    file.seek(0)
+    digest = hashlib.file_digest(file, lambda: hashlib.blake2b(digest_size=16))
+    file.seek(0)
+    return digest.hexdigest()
+
+def hash_files(files):
+    # BLAKE2 releases the GIL on large buffers, so big batches hash in parallel
+    if len(files) <= MAX_WORKERS:
+        return [file_digest_hash(f) for f in files]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return list(executor.map(file_digest_hash, files))
+
+def is_duplicate(new_hash, hashes):
+    return new_hash in hashes
+
+# API helpers
+def _is_rate_limited(error):
+    # Gemini raises ResourceExhausted (code 429), OpenAI raises RateLimitError (status_code 429)
+    return 429 in (getattr(error, "code", None), getattr(error, "status_code", None))
+
+def with_retry(func, *args, **kwargs):
+    for attempt in range(MAX_RETRIES):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if not _is_rate_limited(e) or attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+# Results are cached on the uploaded bytes, so a cache hit skips both the resize and the API call
+@st.cache_data(show_spinner=False, max_entries=64)
+def _identify_one(upload_bytes, upload_type, provider):
+    image_bytes, mime_type = prepare_image(upload_bytes, upload_type)
+
+    if provider == GEMINI:
+        response = with_retry(get_gemini_model().generate_content, [
+            IDENTIFY_PROMPT,
+            {"mime_type": mime_type, "data": image_bytes}
+        ])
+        text = response.text
+    else:
+        base64_image = base64.b64encode(image_bytes).decode('utf-8')
+        response = with_retry(
+            get_openai_client().chat.completions.create,
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": IDENTIFY_PROMPT},
+                        {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}}
+                    ]
+                }
+            ],
+            max_tokens=300
+        )
+        text = response.choices[0].message.content
+
+    items = text.split(',')
+    return [item.strip() for item in items]
+
+def identify_items(images, provider):
+    if not images:
+        return []
+
+    # Remove duplicates case-insensitively as results arrive, keeping the first spelling and the order seen
+    unique_items = {}
+    # Requests run in worker threads; results are merged and errors reported from the script thread
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(images))) as executor:
+        futures = [executor.submit(_identify_one, image["bytes"], image["type"], provider) for image in images]
+        for future in futures:
+            try:
+                for item in future.result():
+                    if item:
+                        unique_items.setdefault(item.lower(), item)
+            except Exception as e:
+                st.error(f"An error occurred while identifying items: {str(e)}")
+
+    return list(unique_items.values())
+
+# Only a handful of diet/cuisine combinations exist, so build each instruction once
+@functools.lru_cache(maxsize=None)
+def preference_instructions(diet_preference, cuisine_preference):
+    diet_instruction = f"The recipe should be {diet_preference.lower()}." if diet_preference != "None" else ""
+    cuisine_instruction = f"The recipe should be {cuisine_preference} cuisine." if cuisine_preference != "Any" else ""
+    return f"{diet_instruction} {cuisine_instruction}"
+
+def recipe_prompt(ingredients, diet_preference, cuisine_preference, num_recipes=1):
+    instructions = preference_instructions(diet_preference, cuisine_preference)
+
+    if num_recipes == 1:
+        return f"Create a recipe using these ingredients: {ingredients}. {instructions} Provide the recipe name, ingredients with quantities, and step-by-step instructions."
+    return f"Create {num_recipes} distinct recipes using these ingredients: {ingredients}. {instructions} For each recipe, provide the recipe name, ingredients with quantities, and step-by-step instructions. Start each recipe with the delimiter '{RECIPE_DELIMITER}' on its own line."
+
+def split_recipes(text, num_recipes):
+    # Anything before the first delimiter is preamble ("Here are your recipes:"), not a recipe
+    pieces = text.split(RECIPE_DELIMITER)
+    if len(pieces) > 1:
+        pieces = pieces[1:]
+    recipes = [recipe.strip() for recipe in pieces]
+    recipes = [recipe for recipe in recipes if recipe]
+    # The preamble is already gone, so surplus pieces are trailing text (e.g. a closing
+    # delimiter followed by "Enjoy!"); keep the first num_recipes
+    return recipes[:num_recipes]
+
+def generate_recipe(prompt, provider):
+    if provider == GEMINI:
+        response = with_retry(get_gemini_model().generate_content, prompt)
+        return response.text
+
+    response = with_retry(
+        get_openai_client().chat.completions.create,
+        model="gpt-4o",
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=OPENAI_RECIPE_MAX_TOKENS
+    )
+    return response.choices[0].message.content
+
+def stream_recipe(prompt, provider, num_recipes=1):
+    if provider == GEMINI:
+        response = with_retry(get_gemini_model().generate_content, prompt, stream=True)
+        for chunk in response:
+            yield chunk.text
+        return
+
+    response = with_retry(
+        get_openai_client().chat.completions.create,
+        model="gpt-4o",
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=OPENAI_RECIPE_MAX_TOKENS * num_recipes,
+        stream=True
+    )
+    for chunk in response:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
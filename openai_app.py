@@ -1,78 +1,27 @@
 import streamlit as st
 from PIL import Image
-import io
-import base64
-import os
 from dotenv import load_dotenv
-from openai import OpenAI
 import imagehash
+from common import OPENAI, make_thumbnail, is_duplicate, identify_items, recipe_prompt, stream_recipe
 
 # Load environment variables
 load_dotenv()
 
-# Set up OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 # Set page config
 st.set_page_config(page_title="Chef's Fridge Recipe Generator", layout="wide")
 
-def image_hash(image):
+def perceptual_hash(image):
     return str(imagehash.average_hash(image))
 
-def is_duplicate(new_image, existing_images):
-    new_hash = image_hash(new_image)
-    for img in existing_images:
-        if image_hash(img) == new_hash:
-            return True
-    return False
-
-def identify_items(images):
-    all_items = []
-    for image in images:
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG")
-        base64_image = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "List all the food items you can see in this fridge image. Provide the list in a comma-separated format."},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                        ]
-                    }
-                ],
-                max_tokens=300
-            )
-            
-            items = response.choices[0].message.content.split(',')
-            all_items.extend([item.strip() for item in items])
-        except Exception as e:
-            st.error(f"An error occurred while identifying items: {str(e)}")
-    
-    return list(set(all_items))  # Remove duplicates
-
 def generate_recipe(items, diet_preference, cuisine_preference):
+    # Render the recipe as tokens arrive; a partial draft is cleared if the stream fails
+    placeholder = st.empty()
     try:
-        diet_instruction = f"The recipe should be {diet_preference.lower()}." if diet_preference != "None" else ""
-        cuisine_instruction = f"The recipe should be {cuisine_preference} cuisine." if cuisine_preference != "Any" else ""
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"Create a recipe using these ingredients: {', '.join(items)}. {diet_instruction} {cuisine_instruction} Provide the recipe name, ingredients with quantities, and step-by-step instructions."
-                }
-            ],
-            max_tokens=500
-        )
-        
-        return response.choices[0].message.content
+        prompt = recipe_prompt(', '.join(items), diet_preference, cuisine_preference)
+        with placeholder.container():
+            return st.write_stream(stream_recipe(prompt, OPENAI))
     except Exception as e:
+        placeholder.empty()
         st.error(f"An error occurred while generating the recipe: {str(e)}")
         return "Unable to generate recipe. Please try again."
 
@@ -81,6 +30,8 @@ def main():
     
     if 'images' not in st.session_state:
         st.session_state.images = []
+    if 'image_hashes' not in st.session_state:
+        st.session_state.image_hashes = set()
     
     col1, col2 = st.columns([1, 1])
     
@@ -92,8 +43,10 @@ def main():
             camera_image = st.camera_input("Take a picture of your fridge contents")
             if camera_image:
                 new_image = Image.open(camera_image)
-                if not is_duplicate(new_image, st.session_state.images):
-                    st.session_state.images.append(new_image)
+                h = perceptual_hash(new_image)
+                if not is_duplicate(h, st.session_state.image_hashes):
+                    st.session_state.images.append({"bytes": camera_image.getvalue(), "type": camera_image.type, "thumb": make_thumbnail(new_image)})
+                    st.session_state.image_hashes.add(h)
                     st.success("Image added successfully!")
         else:
             uploaded_files = st.file_uploader("Upload fridge images", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
@@ -102,8 +55,10 @@ def main():
                 duplicates = 0
                 for uploaded_file in uploaded_files:
                     new_image = Image.open(uploaded_file)
-                    if not is_duplicate(new_image, st.session_state.images):
-                        st.session_state.images.append(new_image)
+                    h = perceptual_hash(new_image)
+                    if not is_duplicate(h, st.session_state.image_hashes):
+                        st.session_state.images.append({"bytes": uploaded_file.getvalue(), "type": uploaded_file.type, "thumb": make_thumbnail(new_image)})
+                        st.session_state.image_hashes.add(h)
                         new_images += 1
                     else:
                         duplicates += 1
@@ -116,15 +71,16 @@ def main():
         if st.session_state.images:
             st.subheader("Captured/Uploaded Images")
             for i, img in enumerate(st.session_state.images):
-                st.image(img, caption=f'Fridge Content Image {i+1}', use_column_width=True)
+                st.image(img["thumb"], caption=f'Fridge Content Image {i+1}', use_column_width=True)
             
             if st.button('Clear All Images'):
                 st.session_state.images = []
+                st.session_state.image_hashes = set()
                 st.experimental_rerun()
             
             if st.button('Identify Ingredients'):
                 with st.spinner('Analyzing fridge contents...'):
-                    identified_items = identify_items(st.session_state.images)
+                    identified_items = identify_items(st.session_state.images, OPENAI)
                     st.session_state.ingredients = identified_items
     
     with col2:
@@ -148,10 +104,9 @@ def main():
             cuisine_preference = st.selectbox("Select cuisine preference:", cuisine_options)
             
             if st.button('Generate Recipe'):
+                st.subheader("Your Recipe")
                 with st.spinner('Crafting your recipe...'):
-                    recipe = generate_recipe(st.session_state.ingredients, diet_preference, cuisine_preference)
-                    st.subheader("Your Recipe")
-                    st.write(recipe)
+                    generate_recipe(st.session_state.ingredients, diet_preference, cuisine_preference)
         else:
             st.info("Take or upload pictures of your fridge contents, then click 'Identify Ingredients' to start.")
 